@@ -70,9 +70,9 @@ final class ApiConfiguration {
    * This is a compile time configurable option that specifies the size of API
    * keys to use, expressed as an integer number of random bytes. Keys are encoded
    * as URL safe Base64 text strings, so key sizes that are divisible by 6 are
-   * recommended.
+   * recommended. The default of 36 bytes gives 288 bits of entropy.
    */
-  private static final int AWS_API_KEY_SIZE = 30;
+  private static final int AWS_API_KEY_SIZE = 36;
 
   /**
    * This is a default option that specifies the name of the DynamoDB table that
@@ -101,11 +101,26 @@ final class ApiConfiguration {
    */
   private static final String AWS_API_KEY_DELETE_CAPABILITY_NAME = "com.zynaptic.aws.api.key.delete";
 
+  /**
+   * This is a default option that specifies the time for which API key
+   * capability sets are cached by each Lambda function instance, expressed as an
+   * integer number of seconds. Set to zero to disable caching.
+   */
+  private static final int AWS_API_KEY_CACHE_TTL_SECONDS = 60;
+
+  /**
+   * This is a default option that specifies the maximum number of API key
+   * capability sets that are cached by each Lambda function instance.
+   */
+  private static final int AWS_API_KEY_CACHE_MAX_ENTRIES = 1024;
+
   // Specify the configuration options loaded from the execution environment.
   private final Regions awsHostRegion;
   private final String awsApiKeyTableName;
   private final String resourceCreatePath;
   private final String resourceAccessPath;
+  private final int awsApiKeyCacheTtlSeconds;
+  private final int awsApiKeyCacheMaxEntries;
 
   /**
    * The standard constructor is used to map execution environment variables to
@@ -141,6 +156,20 @@ final class ApiConfiguration {
     } else {
       resourceAccessPath = AWS_API_RESOURCE_KEY_ACCESS_PATH;
     }
+
+    // Use a custom API key cache time to live if requested.
+    if (env.containsKey("AWS_API_KEY_CACHE_TTL_SECONDS")) {
+      awsApiKeyCacheTtlSeconds = Integer.parseInt(env.get("AWS_API_KEY_CACHE_TTL_SECONDS"));
+    } else {
+      awsApiKeyCacheTtlSeconds = AWS_API_KEY_CACHE_TTL_SECONDS;
+    }
+
+    // Use a custom API key cache size if requested.
+    if (env.containsKey("AWS_API_KEY_CACHE_MAX_ENTRIES")) {
+      awsApiKeyCacheMaxEntries = Integer.parseInt(env.get("AWS_API_KEY_CACHE_MAX_ENTRIES"));
+    } else {
+      awsApiKeyCacheMaxEntries = AWS_API_KEY_CACHE_MAX_ENTRIES;
+    }
   }
 
   /**
@@ -237,4 +266,24 @@ final class ApiConfiguration {
   String getAwsApiKeyDeleteCapabilityName() {
     return AWS_API_KEY_DELETE_CAPABILITY_NAME;
   }
+
+  /**
+   * Accesses the time for which API key capability sets are cached by each Lambda
+   * function instance.
+   * 
+   * @return Returns the cache time to live as an integer number of seconds.
+   */
+  int getAwsApiKeyCacheTtlSeconds() {
+    return awsApiKeyCacheTtlSeconds;
+  }
+
+  /**
+   * Accesses the maximum number of API key capability sets that are cached by
+   * each Lambda function instance.
+   * 
+   * @return Returns the maximum number of cache entries.
+   */
+  int getAwsApiKeyCacheMaxEntries() {
+    return awsApiKeyCacheMaxEntries;
+  }
 }
@@ -68,6 +68,7 @@ public class ApiHandler implements RequestStreamHandler {
   private final ApiConfiguration apiConfiguration;
   private final ApiKeyFactory apiKeyFactory;
   private final ApiKeyCapabilityReader apiKeyCapabilityReader;
+  private final ApiKeyCapabilityCache apiKeyCapabilityCache;
   private final ApiKeyCapabilityWriter apiKeyCapabilityWriter;
   private final ApiKeyCapabilityDeleter apiKeyCapabilityDeleter;
   private final ApiKeyCapabilityParser defaultCapabilityParser;
@@ -94,6 +95,11 @@ public class ApiHandler implements RequestStreamHandler {
     apiKeyCapabilityReader
         .addCapabilityParser(new ApiKeyBasicCapabilityParser(apiConfiguration.getAwsApiKeyDeleteCapabilityName()));
     apiKeyCapabilityReader.setDefaultCapabilityParser(defaultCapabilityParser);
+
+    // Cache capability set lookups for reuse by subsequent requests to this
+    // Lambda function instance.
+    apiKeyCapabilityCache = new ApiKeyCapabilityCache(apiKeyCapabilityReader,
+        apiConfiguration.getAwsApiKeyCacheTtlSeconds(), apiConfiguration.getAwsApiKeyCacheMaxEntries());
   }
 
   /**
@@ -120,6 +126,12 @@ public class ApiHandler implements RequestStreamHandler {
     JsonParser requestParser = jsonFactory.createParser(request.toString());
     JsonNode jsonRequest = objectMapper.readTree(requestParser);
 
+    // Scheduled warmup requests are only used to keep the Lambda function
+    // instance initialised, so no further processing is required.
+    if (jsonRequest.path("warmup").asBoolean(false)) {
+      return;
+    }
+
     // Extract the resource path and method type.
     JsonNode methodNode = jsonRequest.get("httpMethod");
     JsonNode resourceNode = jsonRequest.get("resource");
@@ -169,11 +181,11 @@ public class ApiHandler implements RequestStreamHandler {
     // that the request comes from the correct client domain for CORS enforcement.
 
     // Initiate concurrent database accesses.
-    Future<ApiKeyCapabilitySet> futureApiAuthKeyCapabilitySet = apiKeyCapabilityReader
+    Future<ApiKeyCapabilitySet> futureApiAuthKeyCapabilitySet = apiKeyCapabilityCache
         .getApiKeyCapabilitySet(apiAuthKey);
     Future<ApiKeyCapabilitySet> futureApiAccessKeyCapabilitySet = null;
     if ((apiAccessKey != null) && ((httpMethod.equals("GET") || httpMethod.equals("DELETE")))) {
-      futureApiAccessKeyCapabilitySet = apiKeyCapabilityReader.getApiKeyCapabilitySet(apiAccessKey);
+      futureApiAccessKeyCapabilitySet = apiKeyCapabilityCache.getApiKeyCapabilitySet(apiAccessKey);
     }
 
     // Get the capability set object associated with the API authorisation key and
@@ -512,7 +524,9 @@ public class ApiHandler implements RequestStreamHandler {
       return;
     }
 
-    // Issue a delete request for the DynamoDB table entry.
+    // Issue a delete request for the DynamoDB table entry, removing any locally
+    // cached copy.
+    apiKeyCapabilityCache.invalidate(apiDeleteKeyCapabilitySet.getApiKey());
     try {
       if (!apiKeyCapabilityDeleter.deleteApiKeyCapabilitySet(apiDeleteKeyCapabilitySet.getApiKey()).get()) {
         processError(HttpURLConnection.HTTP_INTERNAL_ERROR, "POST, OPTIONS",
@@ -0,0 +1,199 @@
+/*
+ * Capability based API key management service for AWS Lambda with DynamoDB.
+ *
+ * Copyright (c) 2020, Zynaptic Limited.
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License"); you may not
+ * use this file except in compliance with the License. You may obtain a copy of
+ * the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+ * WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+ * License for the specific language governing permissions and limitations under
+ * the License.
+ *
+ * Please visit www.zynaptic.com or contact reaction@zynaptic.com if you need
+ * additional information or have any questions.
+ */
+
+package com.zynaptic.aws.api.key.manager;
+
+import java.util.LinkedHashMap;
+import java.util.Map;
+import java.util.concurrent.CompletableFuture;
+import java.util.concurrent.ExecutionException;
+import java.util.concurrent.Future;
+import java.util.concurrent.TimeUnit;
+import java.util.concurrent.TimeoutException;
+
+import com.zynaptic.aws.api.key.capability.ApiKeyCapabilityReader;
+import com.zynaptic.aws.api.key.capability.ApiKeyCapabilitySet;
+
+/**
+ * This class provides an in-memory cache of API key capability set lookups.
+ * Since the cache is held by the API handler, it persists between requests that
+ * are processed by the same AWS Lambda function instance. Only capability sets
+ * that were successfully read from the API key table are cached, so failed reads
+ * and unknown API keys are always retried. Cache entries expire after a fixed
+ * time to live, and the least recently used entries are discarded once the
+ * maximum number of entries has been reached.
+ * 
+ * @author Chris Holgate
+ */
+final class ApiKeyCapabilityCache {
+  private final ApiKeyCapabilityReader apiKeyCapabilityReader;
+  private final long cacheTimeToLive;
+  private final LinkedHashMap<String, CacheEntry> cacheEntries;
+
+  /**
+   * Creates a new API key capability cache instance.
+   * 
+   * @param apiKeyCapabilityReader This is the API key capability reader that will
+   *   be used to load capability sets from the API key table.
+   * @param cacheTimeToLive This is the time for which cached capability sets
+   *   remain valid, expressed as an integer number of seconds. A value of zero
+   *   disables caching.
+   * @param cacheMaxEntries This is the maximum number of capability sets that
+   *   will be held in the cache.
+   */
+  ApiKeyCapabilityCache(ApiKeyCapabilityReader apiKeyCapabilityReader, int cacheTimeToLive,
+      final int cacheMaxEntries) {
+    this.apiKeyCapabilityReader = apiKeyCapabilityReader;
+    this.cacheTimeToLive = (cacheMaxEntries > 0) ? 1000L * cacheTimeToLive : 0;
+    this.cacheEntries = new LinkedHashMap<String, CacheEntry>(16, 0.75f, true) {
+      private static final long serialVersionUID = 1L;
+
+      @Override
+      protected boolean removeEldestEntry(Map.Entry<String, CacheEntry> eldest) {
+        return size() > cacheMaxEntries;
+      }
+    };
+  }
+
+  /**
+   * Gets the capability set associated with a given API key. A cached capability
+   * set will be returned if available. Otherwise a new asynchronous read request
+   * will be issued, and the capability set will be added to the cache once the
+   * read request has completed successfully.
+   * 
+   * @param apiKey This is the API key for which the capability set is required.
+   * @return Returns a future capability set that will be populated with the
+   *   capability set for the API key, or a null reference if the API key was not
+   *   found.
+   */
+  synchronized Future<ApiKeyCapabilitySet> getApiKeyCapabilitySet(String apiKey) {
+    long timestamp = System.currentTimeMillis();
+    if (cacheTimeToLive > 0) {
+      CacheEntry cacheEntry = cacheEntries.get(apiKey);
+      if (cacheEntry != null) {
+        if (timestamp - cacheEntry.timestamp < cacheTimeToLive) {
+          return CompletableFuture.completedFuture(cacheEntry.capabilitySet);
+        }
+        cacheEntries.remove(apiKey);
+      }
+    }
+    Future<ApiKeyCapabilitySet> futureCapabilitySet = apiKeyCapabilityReader.getApiKeyCapabilitySet(apiKey);
+    if (cacheTimeToLive > 0) {
+      futureCapabilitySet = new CachingFuture(apiKey, futureCapabilitySet, timestamp);
+    }
+    return futureCapabilitySet;
+  }
+
+  /**
+   * Removes the capability set associated with a given API key from the cache.
+   * This should be called whenever an API key is deleted.
+   * 
+   * @param apiKey This is the API key for which the cached capability set should
+   *   be removed.
+   */
+  synchronized void invalidate(String apiKey) {
+    cacheEntries.remove(apiKey);
+  }
+
+  /*
+   * Adds a successfully read capability set to the cache. The timestamp is the
+   * time at which the read request was issued.
+   */
+  private synchronized void addCacheEntry(String apiKey, ApiKeyCapabilitySet capabilitySet, long timestamp) {
+    cacheEntries.put(apiKey, new CacheEntry(capabilitySet, timestamp));
+  }
+
+  /*
+   * Provides a cache entry that holds the capability set for a given API key and
+   * the time at which it was read from the API key table.
+   */
+  private static final class CacheEntry {
+    private final ApiKeyCapabilitySet capabilitySet;
+    private final long timestamp;
+
+    private CacheEntry(ApiKeyCapabilitySet capabilitySet, long timestamp) {
+      this.capabilitySet = capabilitySet;
+      this.timestamp = timestamp;
+    }
+  }
+
+  /*
+   * Provides a future capability set that wraps an API key table read request.
+   * The capability set is only parsed once, and is added to the cache if the
+   * read request completes successfully with a valid capability set.
+   */
+  private final class CachingFuture implements Future<ApiKeyCapabilitySet> {
+    private final String apiKey;
+    private final Future<ApiKeyCapabilitySet> futureCapabilitySet;
+    private final long timestamp;
+    private boolean resolved = false;
+    private ApiKeyCapabilitySet capabilitySet = null;
+
+    private CachingFuture(String apiKey, Future<ApiKeyCapabilitySet> futureCapabilitySet, long timestamp) {
+      this.apiKey = apiKey;
+      this.futureCapabilitySet = futureCapabilitySet;
+      this.timestamp = timestamp;
+    }
+
+    @Override
+    public boolean cancel(boolean mayInterruptIfRunning) {
+      return futureCapabilitySet.cancel(mayInterruptIfRunning);
+    }
+
+    @Override
+    public boolean isCancelled() {
+      return futureCapabilitySet.isCancelled();
+    }
+
+    @Override
+    public boolean isDone() {
+      return futureCapabilitySet.isDone();
+    }
+
+    @Override
+    public synchronized ApiKeyCapabilitySet get() throws InterruptedException, ExecutionException {
+      if (!resolved) {
+        resolve(futureCapabilitySet.get());
+      }
+      return capabilitySet;
+    }
+
+    @Override
+    public synchronized ApiKeyCapabilitySet get(long timeout, TimeUnit unit)
+        throws InterruptedException, ExecutionException, TimeoutException {
+      if (!resolved) {
+        resolve(futureCapabilitySet.get(timeout, unit));
+      }
+      return capabilitySet;
+    }
+
+    /*
+     * Records the result of the read request, caching valid capability sets.
+     */
+    private void resolve(ApiKeyCapabilitySet newCapabilitySet) {
+      capabilitySet = newCapabilitySet;
+      resolved = true;
+      if (capabilitySet != null) {
+        addCacheEntry(apiKey, capabilitySet, timestamp);
+      }
+    }
+  }
+}
@@ -24,16 +24,16 @@ package com.zynaptic.aws.api.key.manager;
 import java.security.NoSuchAlgorithmException;
 import java.security.SecureRandom;
 import java.util.Base64;
-import java.util.Random;
 
 /**
- * This class provides support for generating new API key values. Where possible
- * a strong random number generator is used to generate the API keys.
+ * This class provides support for generating new API key values. API keys are
+ * always generated using a cryptographically secure random number generator,
+ * using the platform's strong generator where possible.
  * 
  * @author Chris Holgate
  */
 final class ApiKeyFactory {
-  private final Random randomSource;
+  private final SecureRandom randomSource;
   private final int apiKeySize;
   private final Base64.Encoder encoder;
 
@@ -44,16 +44,11 @@ final class ApiKeyFactory {
    *   integer number of bytes.
    */
   ApiKeyFactory(int apiKeySize) {
-    Random newRandomSource = null;
+    SecureRandom newRandomSource = null;
     try {
       newRandomSource = SecureRandom.getInstanceStrong();
-    } catch (NoSuchAlgorithmException err1) {
-      try {
-        newRandomSource = SecureRandom.getInstance("SHA1PRNG");
-      } catch (NoSuchAlgorithmException err2) {
-        newRandomSource = new Random();
-        System.out.println("WARNING: No secure random number source available. Using Java Random.");
-      }
+    } catch (NoSuchAlgorithmException err) {
+      newRandomSource = new SecureRandom();
     }
     this.randomSource = newRandomSource;
     this.apiKeySize = apiKeySize;
@@ -22,22 +22,71 @@
 #
 
 #
-# AWS deployment script. This script makes use of the AWS command line
-# utilities on the local host to deploy the API key management service.
+# AWS deployment script. This script makes use of the AWS SDK for Python
+# (boto3) on the local host to deploy the API key management service.
 # The default AWS command line credentials and option settings will be
 # used.
 #
 
-import os
 import argparse
 import json
+import io
 import base64
 import secrets
 import datetime
+import hashlib
+import mimetypes
+import subprocess
+import zipfile
+import boto3
+import requests
 import configuration
 import cloudformation
 
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+from awsutils import resolveAwsRegion
+from decimal import Decimal
+
+#
+# Specify the CloudFormation stack tag that is used to record the hash
+# of the deployed template, deployment package and root capability set.
+#
+DEPLOYMENT_HASH_TAG = "deploy-hash"
+
+#
+# Use the location of this script to determine the repository root
+# directory.
+#
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+#
+# Specify the S3 transfer settings used when uploading deployment files.
+# Files larger than 8MiB are split into parts which are uploaded
+# concurrently, and up to 10 requests may be in progress at once.
+#
+DEPLOYMENT_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=10,
+    use_threads=True,
+)
+
+#
+# Specify the serializer used to map native Python values to DynamoDB
+# attribute values.
+#
+DYNAMO_TYPE_SERIALIZER = TypeSerializer()
+
+#
+# Specify the polling settings used when waiting for CloudFormation stack
+# operations to complete. Stacks are polled every 10 seconds for up to 60
+# minutes, which matches the default AWS command line timeout.
+#
+STACK_WAITER_CONFIG = {"Delay": 10, "MaxAttempts": 360}
 
 #
 # Extract the command line arguments.
@@ -50,13 +99,12 @@ def parseCommandLine():
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
     )
 
-    # Derive the default AWS region from the configuration options.
-    with os.popen("aws configure get region", "r") as f:
-        awsRegion = f.read().strip()
-
     # Parse the optional parameters.
     parser.add_argument(
-        "--region", default=awsRegion, help="the name of the AWS region to use"
+        "--region",
+        default=None,
+        help="the name of the AWS region to use (defaults to the configured "
+        + "AWS region)",
     )
     parser.add_argument(
         "--deployment_bucket",
@@ -93,72 +141,73 @@ def parseCommandLine():
         default=None,
         help="the custom domain name to be used by the AWS API gateway",
     )
+    parser.add_argument(
+        "--idempotent",
+        action="store_true",
+        help="skip the deployment if an identical stack is already deployed",
+    )
+    parser.add_argument(
+        "--keep_template",
+        action="store_true",
+        help="keep a local copy of the generated CloudFormation template",
+    )
     args = parser.parse_args()
+
+    # Derive the default AWS region if no region was specified on the
+    # command line.
+    if args.region == None:
+        args.region = resolveAwsRegion()
+        if args.region == None:
+            parser.error("no AWS region specified or configured")
     return args
 
 
 #
-# Use the AWS command line tools to check whether the API key database
-# is already present. The deployment process is halted if an active
-# key database is currently in use.
+# Check whether the API key database is already present. The deployment
+# process is halted if an active key database is currently in use.
 #
-def checkKeyDatabase(awsRegion, databaseName):
-    with os.popen(
-        "aws dynamodb list-tables --region " + awsRegion + " --no-paginate", "r"
-    ) as f:
-        tableList = json.loads(f.read())
-    for tableName in tableList["TableNames"]:
-        assert tableName != databaseName, (
-            "API key database '%s' is already configured for this AWS region."
-            % tableName
-        )
+def checkKeyDatabase(dynamoDbClient, databaseName):
+    try:
+        dynamoDbClient.describe_table(TableName=databaseName)
+        tableExists = True
+    except dynamoDbClient.exceptions.ResourceNotFoundException:
+        tableExists = False
+    assert not tableExists, (
+        "API key database '%s' is already configured for this AWS region."
+        % databaseName
+    )
 
 
 #
-# Use the AWS command line tools to check whether the S3 deployment
-# bucket is present and create it if required.
-#
-def checkDeploymentBucket(awsRegion, bucketName):
-    with os.popen(
-        "aws s3api list-buckets --region " + awsRegion + " --no-paginate", "r"
-    ) as f:
-        bucketList = json.loads(f.read())
-    for bucketInfo in bucketList["Buckets"]:
-        if bucketInfo["Name"] == bucketName:
-            print("AWS S3 deployment bucket '%s' already configured." % bucketName)
-            return
-    createBucketCommand = (
-        "aws s3api create-bucket --bucket "
-        + bucketName
-        + " --region "
-        + awsRegion
-        + " --create-bucket-configuration LocationConstraint="
-        + awsRegion
+# Check whether the S3 deployment bucket is present and create it if
+# required.
+#
+def checkDeploymentBucket(s3Client, awsRegion, bucketName):
+    try:
+        s3Client.head_bucket(Bucket=bucketName)
+        print("AWS S3 deployment bucket '%s' already configured." % bucketName)
+        return
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("404", "NoSuchBucket"):
+            raise
+    status = s3Client.create_bucket(
+        Bucket=bucketName,
+        CreateBucketConfiguration={"LocationConstraint": awsRegion},
     )
-    with os.popen(createBucketCommand, "r") as f:
-        status = json.loads(f.read())
     print("Created AWS S3 deployment bucket: %s" % status["Location"])
 
 
 #
-# Use the AWS command line tools to check that the specified domain name
-# is configured for use with the AWS API gateway.
+# Check that the specified domain name is configured for use with the
+# AWS API gateway.
 #
-def checkDnsRegistration(awsRegion, domainName):
+def checkDnsRegistration(apiGatewayClient, domainName):
 
-    # Read the list of domain names associated with the API gateway.
-    readDomainNameInfoCommand = (
-        "aws apigateway get-domain-names --region  " + awsRegion + " --no-paginate"
-    )
-    with os.popen(readDomainNameInfoCommand, "r") as f:
-        domainNameInfo = json.loads(f.read())
-
-    # Search for a matching domain name.
-    matchedDomain = None
-    for domainNameItem in domainNameInfo["items"]:
-        if domainNameItem["domainName"] == domainName:
-            matchedDomain = domainNameItem
-            break
+    # Read the domain name information from the API gateway.
+    try:
+        matchedDomain = apiGatewayClient.get_domain_name(domainName=domainName)
+    except apiGatewayClient.exceptions.NotFoundException:
+        matchedDomain = None
     assert matchedDomain != None, (
         "Failed to find configured domain name for '" + domainName + "'"
     )
@@ -170,82 +219,136 @@ def checkDnsRegistration(awsRegion, domainName):
 
 
 #
-# Use the AWS command line tools to upload a file to the S3 deployment
-# bucket.
-#
-def uploadDeploymentFile(awsRegion, bucketName, packageName, packageFile):
-    uploadFileCommand = (
-        "aws s3api put-object --region "
-        + awsRegion
-        + " --bucket "
-        + bucketName
-        + " --key "
-        + packageName
-        + " --body "
-        + str(packageFile)
-    )
-    with os.popen(uploadFileCommand, "r") as f:
-        status = json.loads(f.read())
-    packageTag = status["ETag"]
-    print("Uploaded %s with S3 tag %s" % (packageName, packageTag))
-
-
-#
-# Initiates the CloudFormation stack creation process.
-#
-def createStack(awsRegion, bucketName, stackName, templateName):
-    createStackCommand = (
-        "aws cloudformation create-stack --stack-name "
-        + stackName
-        + " --template-url https://"
-        + bucketName
-        + ".s3."
-        + awsRegion
-        + ".amazonaws.com/"
-        + templateName
-        + " --capabilities CAPABILITY_IAM"
+# Perform the pre-deployment checks. These access independent AWS
+# services so they are run concurrently, with any check failures being
+# raised when the results are collected.
+#
+def runPreDeploymentChecks(
+    dynamoDbClient,
+    s3Client,
+    apiGatewayClient,
+    awsRegion,
+    databaseName,
+    deploymentBucket,
+    domainName,
+):
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        checks = [
+            executor.submit(checkKeyDatabase, dynamoDbClient, databaseName),
+            executor.submit(
+                checkDeploymentBucket, s3Client, awsRegion, deploymentBucket
+            ),
+        ]
+        if domainName != None:
+            checks.append(
+                executor.submit(checkDnsRegistration, apiGatewayClient, domainName)
+            )
+        for check in checks:
+            check.result()
+
+
+#
+# Reads the description of a previously deployed CloudFormation stack.
+# Returns 'None' if no stack with the specified name exists.
+#
+def findDeployedStack(cloudFormationClient, stackName):
+    try:
+        status = cloudFormationClient.describe_stacks(StackName=stackName)
+    except ClientError as e:
+        if "does not exist" not in e.response["Error"]["Message"]:
+            raise
+        return None
+    return status["Stacks"][0]
+
+
+#
+# Derives the deployment hash for a given template, deployment package
+# and root capability set. The names and contents of the files in the
+# deployment package are hashed rather than the package itself, since
+# the package also records the time at which each file was built.
+#
+def deriveDeploymentHash(template, packageFile, capabilitySet):
+    deploymentHash = hashlib.sha256(template)
+    with zipfile.ZipFile(packageFile) as packageArchive:
+        packageEntries = sorted(packageArchive.infolist(), key=lambda e: e.filename)
+        for packageEntry in packageEntries:
+            entryHeader = packageEntry.filename + "\0" + str(packageEntry.file_size)
+            deploymentHash.update(entryHeader.encode("utf-8") + b"\0")
+            with packageArchive.open(packageEntry) as f:
+                for packageData in iter(lambda: f.read(1024 * 1024), b""):
+                    deploymentHash.update(packageData)
+    capabilityJson = json.dumps(capabilitySet, sort_keys=True, default=str)
+    deploymentHash.update(capabilityJson.encode("utf-8"))
+    return deploymentHash.hexdigest()
+
+
+#
+# Upload a set of files to the S3 deployment bucket. The files are
+# specified as a mapping from the S3 object name to a local file path or
+# file object. All uploads are queued on a single S3 transfer manager so
+# that they run concurrently and share the same connection pool.
+#
+def uploadDeploymentFiles(s3Client, bucketName, deploymentFiles):
+    with create_transfer_manager(
+        s3Client, DEPLOYMENT_TRANSFER_CONFIG
+    ) as transferManager:
+        uploads = []
+        for fileName, fileSource in deploymentFiles.items():
+            contentType = mimetypes.guess_type(fileName)[0]
+            uploads.append(
+                transferManager.upload(
+                    fileSource,
+                    bucketName,
+                    fileName,
+                    extra_args={"ContentType": contentType or "binary/octet-stream"},
+                )
+            )
+        for upload in uploads:
+            upload.result()
+    for fileName in deploymentFiles:
+        status = s3Client.head_object(Bucket=bucketName, Key=fileName)
+        print("Uploaded %s with S3 tag %s" % (fileName, status["ETag"]))
+
+
+#
+# Initiates the CloudFormation stack creation process and waits for it
+# to complete.
+#
+def createStack(cloudFormationClient, awsRegion, bucketName, stackName, templateName):
+    templateUrl = f"https://{bucketName}.s3.{awsRegion}.amazonaws.com/{templateName}"
+    status = cloudFormationClient.create_stack(
+        StackName=stackName,
+        TemplateURL=templateUrl,
+        Capabilities=["CAPABILITY_IAM"],
     )
-    with os.popen(createStackCommand, "r") as f:
-        status = json.loads(f.read())
     stackId = status["StackId"]
     print("Creating stack : " + stackId)
-    os.system("aws cloudformation wait stack-create-complete --stack-name " + stackId)
+    waiter = cloudFormationClient.get_waiter("stack_create_complete")
+    waiter.wait(StackName=stackId, WaiterConfig=STACK_WAITER_CONFIG)
     print("Stack creation complete")
 
 
 #
-# Formats a data item in DynamoDB attribute format.
-#
-def formatDynamoAttr(value):
-    if isinstance(value, str):
-        return {"S": value}
-    elif isinstance(value, bool):
-        return {"BOOL": value}
-    elif isinstance(value, (int, float)):
-        return {"N": str(value)}
-    elif isinstance(value, dict):
-        return {"M": mapToDynamoAttrs(value)}
-    elif isinstance(value, list):
-        attrList = []
-        for listItem in value:
-            attrList.append(formatDynamoAttr(listItem))
-        return {"L": attrList}
-
-
-#
-# Converts a native dictionary to DynamoDB attribute format.
+# Tags the deployed stack with the deployment hash so that unchanged
+# deployments can be detected. This should only be done once the stack
+# has been created, the root key has been loaded and the API has been
+# tested.
 #
-def mapToDynamoAttrs(pythonDict):
-    dynamoAttrs = {}
-    for item in pythonDict.items():
-        dynamoAttrs[item[0]] = formatDynamoAttr(item[1])
-    return dynamoAttrs
+def tagDeployedStack(cloudFormationClient, stackName, deploymentHash):
+    cloudFormationClient.update_stack(
+        StackName=stackName,
+        UsePreviousTemplate=True,
+        Capabilities=["CAPABILITY_IAM"],
+        Tags=[{"Key": DEPLOYMENT_HASH_TAG, "Value": deploymentHash}],
+    )
+    waiter = cloudFormationClient.get_waiter("stack_update_complete")
+    waiter.wait(StackName=stackName, WaiterConfig=STACK_WAITER_CONFIG)
 
 
 #
 # Loads the root key into the API key database.
 #
-def loadRootKey(awsRegion, databaseName, capabilitySet):
+def loadRootKey(dynamoDbClient, databaseName, capabilitySet):
     rootKeyBytes = secrets.token_bytes(configuration.API_KEY_GENERATION_SIZE)
     rootKey = base64.urlsafe_b64encode(rootKeyBytes).decode("utf-8")
     expiryDate = datetime.datetime(9999, 12, 31, 0, 0)
@@ -259,21 +362,17 @@ def loadRootKey(awsRegion, databaseName, capabilitySet):
         "expiryTimestamp": expiryTimestamp,
         "capabilitySet": capabilitySet,
     }
-    tableEntryAttrs = mapToDynamoAttrs(tableEntry)
-    tableEntryJson = json.dumps(tableEntryAttrs)
-
-    # Write the DynamoDB entry via the AWS CLI.
-    writeEntryCommand = (
-        "aws dynamodb put-item --region "
-        + awsRegion
-        + " --table-name "
-        + databaseName
-        + " --item '"
-        + tableEntryJson
-        + "' --return-consumed-capacity TOTAL"
+    tableEntryAttrs = {
+        name: DYNAMO_TYPE_SERIALIZER.serialize(value)
+        for name, value in tableEntry.items()
+    }
+
+    # Write the DynamoDB entry.
+    status = dynamoDbClient.put_item(
+        TableName=databaseName,
+        Item=tableEntryAttrs,
+        ReturnConsumedCapacity="TOTAL",
     )
-    with os.popen(writeEntryCommand, "r") as f:
-        status = json.loads(f.read())
     print("Loaded root key into " + status["ConsumedCapacity"]["TableName"])
     return rootKey
 
@@ -281,26 +380,18 @@ def loadRootKey(awsRegion, databaseName, capabilitySet):
 #
 # Derives the base URL for the API.
 #
-def deriveApiBaseUrl(awsRegion, stackName, deploymentStage):
+def deriveApiBaseUrl(cloudFormationClient, awsRegion, stackName, deploymentStage):
 
     # Read the deployed API ID from CloudFormation.
-    readApiMetadataCommand = (
-        "aws cloudformation describe-stack-resource --stack-name "
-        + stackName
-        + " --logical-resource-id ApiKeyRestGateway"
+    status = cloudFormationClient.describe_stack_resource(
+        StackName=stackName, LogicalResourceId="ApiKeyRestGateway"
     )
-    with os.popen(readApiMetadataCommand, "r") as f:
-        status = json.loads(f.read())
     awsResourceId = status["StackResourceDetail"]["PhysicalResourceId"]
 
     # Build the base URL for the API.
     return (
-        "https://"
-        + awsResourceId
-        + ".execute-api."
-        + awsRegion
-        + ".amazonaws.com/"
-        + deploymentStage
+        f"https://{awsResourceId}.execute-api.{awsRegion}.amazonaws.com"
+        f"/{deploymentStage}"
     )
 
 
@@ -311,27 +402,27 @@ def derivePublicBaseUrl(domainName):
     if domainName == None:
         return None
     else:
-        return (
-            "https://"
-            + domainName
-            + "/"
-            + configuration.RESOURCE_CUSTOM_DOMAIN_BASE_PATH
-        )
+        return f"https://{domainName}/{configuration.RESOURCE_CUSTOM_DOMAIN_BASE_PATH}"
 
 
 #
-# Runs a test read on the root key URL.
+# Runs a test read on the root key URL using the specified HTTP session.
 #
-def testReadRootKey(baseUrl, rootKey):
+def testReadRootKey(httpSession, baseUrl, rootKey):
     rootKeyUrl = baseUrl + configuration.RESOURCE_KEY_ACCESS_PATH
     rootKeyUrl = rootKeyUrl.replace("{apiKey}", rootKey)
     print("Reading key from " + rootKeyUrl)
-    curlCommand = (
-        "curl --no-progress-meter -H x-zynaptic-api-key:" + rootKey + " " + rootKeyUrl
+    response = httpSession.get(
+        rootKeyUrl, headers={"x-zynaptic-api-key": rootKey}, timeout=30
     )
-    with os.popen(curlCommand, "r") as f:
-        status = json.loads(f.read())
-    print(json.dumps(status, indent=4))
+
+    # Error responses from the API gateway may not be valid JSON, so the
+    # raw response body is displayed instead.
+    try:
+        print(json.dumps(response.json(), indent=4))
+    except ValueError:
+        print(response.text)
+    response.raise_for_status()
 
 
 #
@@ -339,10 +430,6 @@ def testReadRootKey(baseUrl, rootKey):
 #
 def main(params):
 
-    # Use the location of this script to determine the repository root
-    # directory.
-    rootDir = Path(__file__).resolve().parent.parent
-
     # Prepend deployment stage name to domain name for non-production
     # deployments.
     if params.deployment_stage == "production":
@@ -362,29 +449,75 @@ def main(params):
     # Use dedicated regional deployment bucket.
     deploymentBucket = params.deployment_bucket + "-" + params.region
 
-    # Perform pre-deployment checks.
-    checkKeyDatabase(params.region, databaseName)
-    checkDeploymentBucket(params.region, deploymentBucket)
-    if domainName != None:
-        checkDnsRegistration(params.region, domainName)
-
-    # Run the Maven build and then upload the deployment package. The
-    # deployment package name is inferred by looking for the only .jar
-    # file in the build directory.
-    os.system("cd %s && mvn install" % (rootDir))
-    targetPath = rootDir / "target"
+    # Load the root capability set if specified. This is done before any
+    # deployment steps so that invalid capability files are rejected
+    # early. Floating point values are loaded as decimals, as required
+    # for DynamoDB number attributes.
+    if params.capability_file == None:
+        capabilitySet = {}
+    else:
+        with open(params.capability_file, "r") as f:
+            capabilitySet = json.loads(f.read(), parse_float=Decimal)
+
+    # Include required capabilities for API key management. Capabilities
+    # specified in the root capability set take precedence.
+    capabilitySet = {
+        configuration.API_KEY_CREATE_CAPABILITY_NAME: {"capabilityLock": False},
+        configuration.API_KEY_READ_CAPABILITY_NAME: {},
+        configuration.API_KEY_DELETE_CAPABILITY_NAME: {},
+        **capabilitySet,
+    }
+
+    # Create the AWS service clients for the selected region. These are
+    # reused for all AWS requests issued by the deployment process.
+    awsSession = boto3.Session(region_name=params.region)
+    dynamoDbClient = awsSession.client("dynamodb")
+    s3Client = awsSession.client("s3")
+    cloudFormationClient = awsSession.client("cloudformation")
+    apiGatewayClient = awsSession.client("apigateway")
+
+    # When running idempotent deployments, check for an existing stack that
+    # may already match the current deployment.
+    if params.idempotent:
+        deployedStack = findDeployedStack(cloudFormationClient, stackName)
+    else:
+        deployedStack = None
+
+    # Start the Maven build in the background, since it does not depend on
+    # the outcome of the pre-deployment checks. The checks are deferred if
+    # an existing stack needs to be compared with the build output.
+    mavenBuild = subprocess.Popen(["mvn", "install"], cwd=ROOT_DIR)
+    try:
+        if deployedStack == None:
+            runPreDeploymentChecks(
+                dynamoDbClient,
+                s3Client,
+                apiGatewayClient,
+                params.region,
+                databaseName,
+                deploymentBucket,
+                domainName,
+            )
+    except BaseException:
+
+        # Stop the background build if the deployment has been halted.
+        mavenBuild.terminate()
+        mavenBuild.wait()
+        raise
+
+    # Wait for the Maven build to complete. The deployment package name is
+    # inferred by looking for the only .jar file in the build directory.
+    if mavenBuild.wait() != 0:
+        raise subprocess.CalledProcessError(mavenBuild.returncode, mavenBuild.args)
+    targetPath = ROOT_DIR / "target"
     jarFiles = list(targetPath.glob("*.jar"))
     assert (
         len(jarFiles) == 1
     ), "Maven build should produce exactly one target .jar file."
     deploymentPackageFile = jarFiles[0]
     deploymentPackageName = deploymentPackageFile.name
-    uploadDeploymentFile(
-        params.region, deploymentBucket, deploymentPackageName, deploymentPackageFile
-    )
 
-    # Create the CloudFormation template and upload it to the deployment
-    # bucket.
+    # Create the CloudFormation template.
     templateName = stackName + "-template.json"
     template = cloudformation.createTemplate(
         databaseName=databaseName,
@@ -393,38 +526,76 @@ def main(params):
         apiGatewayName=apiGatewayName,
         deploymentStage=params.deployment_stage,
         domainName=domainName,
-        doFormat=True,
     )
-    print("Writing CloudFormation template to " + templateName)
-    with open(templateName, "w") as f:
-        f.write(template)
-    uploadDeploymentFile(params.region, deploymentBucket, templateName, templateName)
+    if params.keep_template:
+        print("Writing CloudFormation template to " + templateName)
+        with open(templateName, "wb") as f:
+            f.write(template)
+
+    # Skip the deployment if the existing stack was successfully deployed
+    # with the same template, deployment package and root capability set.
+    # Otherwise run the deferred pre-deployment checks.
+    deploymentHash = deriveDeploymentHash(
+        template, deploymentPackageFile, capabilitySet
+    )
+    if deployedStack != None:
+        if deployedStack["StackStatus"] in ("CREATE_COMPLETE", "UPDATE_COMPLETE"):
+            stackTags = deployedStack.get("Tags", [])
+        else:
+            stackTags = []
+        for stackTag in stackTags:
+            if (stackTag["Key"] == DEPLOYMENT_HASH_TAG) and (
+                stackTag["Value"] == deploymentHash
+            ):
+                print("No changes to deploy for stack " + stackName)
+                return
+        runPreDeploymentChecks(
+            dynamoDbClient,
+            s3Client,
+            apiGatewayClient,
+            params.region,
+            databaseName,
+            deploymentBucket,
+            domainName,
+        )
+
+    # Upload the deployment package and the CloudFormation template to the
+    # deployment bucket.
+    uploadDeploymentFiles(
+        s3Client,
+        deploymentBucket,
+        {
+            deploymentPackageName: str(deploymentPackageFile),
+            templateName: io.BytesIO(template),
+        },
+    )
 
     # Run the CloudFormation stack creation process.
-    createStack(params.region, deploymentBucket, stackName, templateName)
+    createStack(
+        cloudFormationClient,
+        params.region,
+        deploymentBucket,
+        stackName,
+        templateName,
+    )
 
-    # Load the root capability set if specified.
-    if params.capability_file == None:
-        capabilitySet = {}
-    else:
-        with open(params.capability_file, "r") as f:
-            capabilitySet = json.loads(f.read())
-
-    # Include required capabilities for API key management.
-    if configuration.API_KEY_CREATE_CAPABILITY_NAME not in capabilitySet:
-        capabilitySet[configuration.API_KEY_CREATE_CAPABILITY_NAME] = {
-            "capabilityLock": False
-        }
-    if configuration.API_KEY_READ_CAPABILITY_NAME not in capabilitySet:
-        capabilitySet[configuration.API_KEY_READ_CAPABILITY_NAME] = {}
-    if configuration.API_KEY_DELETE_CAPABILITY_NAME not in capabilitySet:
-        capabilitySet[configuration.API_KEY_DELETE_CAPABILITY_NAME] = {}
-
-    # Load the root key to the key database.
-    rootKey = loadRootKey(params.region, databaseName, capabilitySet)
-
-    # Derive and report the base URI to use when accessing the API.
-    apiBaseUrl = deriveApiBaseUrl(params.region, stackName, params.deployment_stage)
+    # Load the root key to the key database and derive the base URI to use
+    # when accessing the API. These are independent so are run concurrently.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        rootKeyLoader = executor.submit(
+            loadRootKey, dynamoDbClient, databaseName, capabilitySet
+        )
+        apiBaseUrlReader = executor.submit(
+            deriveApiBaseUrl,
+            cloudFormationClient,
+            params.region,
+            stackName,
+            params.deployment_stage,
+        )
+        rootKey = rootKeyLoader.result()
+        apiBaseUrl = apiBaseUrlReader.result()
+
+    # Report the base URIs to use when accessing the API.
     publicBaseUrl = derivePublicBaseUrl(domainName)
     print(
         "\n--------------------------------------------------------------------------------\n"
@@ -451,23 +622,36 @@ def main(params):
         "\n--------------------------------------------------------------------------------\n"
     )
 
-    # Test access to the API using CURL.
-    testReadRootKey(apiBaseUrl, rootKey)
-    if publicBaseUrl != None:
-        testReadRootKey(publicBaseUrl, rootKey)
+    # Test access to the API, reusing the same HTTP session for all
+    # requests.
+    with requests.Session() as httpSession:
+        testReadRootKey(httpSession, apiBaseUrl, rootKey)
+        if publicBaseUrl != None:
+            testReadRootKey(httpSession, publicBaseUrl, rootKey)
     print(
         "\n--------------------------------------------------------------------------------"
     )
 
-
-#
-# Run the script with the provided command line options.
-#
-try:
-    params = parseCommandLine()
-    main(params)
-except KeyboardInterrupt as e:
-    exit()
-except Exception as e:
-    print(e)
-    exit()
+    # Record the deployment hash for idempotent deployments now that the
+    # deployment has succeeded. A tagging failure does not affect the
+    # deployed stack, so it is only reported as a warning.
+    if params.idempotent:
+        try:
+            tagDeployedStack(cloudFormationClient, stackName, deploymentHash)
+        except Exception as e:
+            print("Warning: failed to tag stack with deployment hash : " + str(e))
+
+
+#
+# Run the script with the provided command line options if invoked
+# directly.
+#
+if __name__ == "__main__":
+    try:
+        params = parseCommandLine()
+        main(params)
+    except KeyboardInterrupt as e:
+        exit()
+    except Exception as e:
+        print(e)
+        exit()
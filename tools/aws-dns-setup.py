@@ -22,10 +22,10 @@
 #
 
 #
-# AWS DNS setup script. This script makes use of the AWS command line
-# utilities on the local host to set up the AWS Route53 DNS service
-# when using a custom domain for API endpoints. The default AWS command
-# line credentials and option settings will be used.
+# AWS DNS setup script. This script makes use of the AWS SDK for Python
+# (boto3) on the local host to set up the AWS Route53 DNS service when
+# using a custom domain for API endpoints. The default AWS command line
+# credentials and option settings will be used.
 #
 # The DNS setup is implemented as an independent CloudFormation stack
 # since the same DNS configuration can be shared by multiple API
@@ -33,10 +33,36 @@
 # supported.
 #
 
-import os
+import time
 import argparse
 import json
-import configuration
+import boto3
+
+from botocore.config import Config
+from awsutils import resolveAwsRegion
+from configuration import AWS_CLOUD_FORMATION_DEFAULT_DNS_STACK_NAME
+
+#
+# Specify the minimum and maximum delays in seconds between stack status
+# requests, and the overall stack creation timeout. The 60 minute timeout
+# matches the default AWS command line timeout, since certificate
+# validation can take a long time to complete.
+#
+STACK_POLL_MIN_DELAY = 5
+STACK_POLL_MAX_DELAY = 60
+STACK_POLL_TIMEOUT = 3600
+
+#
+# Specify the configuration shared by all AWS service clients. Adaptive
+# retries are used so that throttled requests are retried with client
+# side rate limiting, and explicit timeouts prevent stalled connections
+# from blocking the deployment.
+#
+AWS_CLIENT_CONFIG = Config(
+    retries={"max_attempts": 10, "mode": "adaptive"},
+    connect_timeout=5,
+    read_timeout=30,
+)
 
 #
 # Extract the command line arguments.
@@ -50,10 +76,6 @@ def parseCommandLine():
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
     )
 
-    # Derive the default AWS region from the configuration options.
-    with os.popen("aws configure get region", "r") as f:
-        awsRegion = f.read().strip()
-
     # Parse the optional parameters.
     parser.add_argument(
         "--domain_name",
@@ -61,11 +83,14 @@ def parseCommandLine():
         help="the custom domain name to be used by the AWS API gateway",
     )
     parser.add_argument(
-        "--region", default=awsRegion, help="the name of the AWS region to use"
+        "--region",
+        default=None,
+        help="the name of the AWS region to use (defaults to the configured "
+        + "AWS region)",
     )
     parser.add_argument(
         "--stack_name",
-        default=configuration.AWS_CLOUD_FORMATION_DEFAULT_DNS_STACK_NAME,
+        default=AWS_CLOUD_FORMATION_DEFAULT_DNS_STACK_NAME,
         help="the name of the AWS CloudFormation stack to use",
     )
     parser.add_argument(
@@ -73,24 +98,43 @@ def parseCommandLine():
         default="testing",
         help="the API deployment staging name to use",
     )
+    parser.add_argument(
+        "--keep_template",
+        action="store_true",
+        help="keep a local copy of the generated CloudFormation template",
+    )
     args = parser.parse_args()
+
+    # Derive the default AWS region if no region was specified on the
+    # command line.
+    if args.region == None:
+        args.region = resolveAwsRegion()
+        if args.region == None:
+            parser.error("no AWS region specified or configured")
     return args
 
 
 #
-# Use the AWS command line tools to check that the specified domain name
-# is managed by AWS Route53. This also extracts the Route53 hosted zone
-# ID for use when creating the TLS certificate.
+# Check that the specified domain name is managed by AWS Route53. This
+# also extracts the Route53 hosted zone ID for use when creating the TLS
+# certificate. Where multiple hosted zones could serve the domain, the
+# most specific zone is selected.
 #
-def checkDnsRegistration(domainName):
-    with os.popen("aws route53 list-hosted-zones --no-paginate") as f:
-        hostedZoneInfo = json.loads(f.read())
+def checkDnsRegistration(route53Client, domainName):
+    domainLabels = domainName.rstrip(".").split(".")
 
-    # Perform a subdomain match to find a matching hosted zone.
-    fullyQualifiedDomainName = domainName + "."
-    for hostedZone in hostedZoneInfo["HostedZones"]:
-        if fullyQualifiedDomainName.endswith("." + hostedZone["Name"]):
-            hostedZoneId = hostedZone["Id"]
+    # Look up each parent domain in turn, starting with the longest. This
+    # only requires one Route53 request per domain label, regardless of the
+    # number of hosted zones in the account.
+    hostedZoneId = None
+    for i in range(1, len(domainLabels)):
+        parentDomainName = ".".join(domainLabels[i:]) + "."
+        hostedZoneInfo = route53Client.list_hosted_zones_by_name(
+            DNSName=parentDomainName, MaxItems="1"
+        )
+        hostedZones = hostedZoneInfo["HostedZones"]
+        if len(hostedZones) > 0 and hostedZones[0]["Name"] == parentDomainName:
+            hostedZoneId = hostedZones[0]["Id"]
             break
 
     # Remove the path component from the hosted zone ID.
@@ -103,37 +147,37 @@ def checkDnsRegistration(domainName):
 
 
 #
-# Creates the API custom domain name configuration.
+# Creates the API custom domain name configuration. The resource
+# templates are added to the specified resources dictionary, which is
+# then returned to the caller.
 #
-def createApiCustomDomain(domainName, dnsHostedZoneId):
+def createApiCustomDomain(domainName, dnsHostedZoneId, resources=None):
+    if resources == None:
+        resources = {}
 
     # Defines the TLS certificate to be used by the domain. This assumes
     # the domain is fully managed by AWS Route53 so that this can be
     # automatically configured using DNS authorisation.
-    customDomainCert = {
-        "ApiGatewayCert": {
-            "Type": "AWS::CertificateManager::Certificate",
-            "Properties": {
-                "DomainName": domainName,
-                "ValidationMethod": "DNS",
-                "DomainValidationOptions": [
-                    {"DomainName": domainName, "HostedZoneId": dnsHostedZoneId}
-                ],
-            },
-        }
+    resources["ApiGatewayCert"] = {
+        "Type": "AWS::CertificateManager::Certificate",
+        "Properties": {
+            "DomainName": domainName,
+            "ValidationMethod": "DNS",
+            "DomainValidationOptions": [
+                {"DomainName": domainName, "HostedZoneId": dnsHostedZoneId}
+            ],
+        },
     }
 
     # Defines the custom domain to be used.
-    customDomainDefinition = {
-        "ApiGatewayDomain": {
-            "Type": "AWS::ApiGateway::DomainName",
-            "Properties": {
-                "DomainName": domainName,
-                "RegionalCertificateArn": {"Ref": "ApiGatewayCert"},
-                "EndpointConfiguration": {"Types": ["REGIONAL"]},
-                "SecurityPolicy": "TLS_1_2",
-            },
-        }
+    resources["ApiGatewayDomain"] = {
+        "Type": "AWS::ApiGateway::DomainName",
+        "Properties": {
+            "DomainName": domainName,
+            "RegionalCertificateArn": {"Ref": "ApiGatewayCert"},
+            "EndpointConfiguration": {"Types": ["REGIONAL"]},
+            "SecurityPolicy": "TLS_1_2",
+        },
     }
 
     # Insert a DNS 'A' record for the DNS name alias.
@@ -141,43 +185,59 @@ def createApiCustomDomain(domainName, dnsHostedZoneId):
         "DNSName": {"Fn::GetAtt": ["ApiGatewayDomain", "RegionalDomainName"]},
         "HostedZoneId": {"Fn::GetAtt": ["ApiGatewayDomain", "RegionalHostedZoneId"]},
     }
-    dnsRecordDefinition = {
-        "ApiGatewayDnsRecord": {
-            "Type": "AWS::Route53::RecordSet",
-            "DependsOn": "ApiGatewayDomain",
-            "Properties": {
-                "Type": "A",
-                "AliasTarget": aliasTarget,
-                "HostedZoneId": dnsHostedZoneId,
-                "Name": domainName,
-            },
-        }
+    resources["ApiGatewayDnsRecord"] = {
+        "Type": "AWS::Route53::RecordSet",
+        "DependsOn": "ApiGatewayDomain",
+        "Properties": {
+            "Type": "A",
+            "AliasTarget": aliasTarget,
+            "HostedZoneId": dnsHostedZoneId,
+            "Name": domainName,
+        },
     }
-    return {**customDomainCert, **customDomainDefinition, **dnsRecordDefinition}
+    return resources
 
 
 #
-# Initiates the CloudFormation stack creation process.
+# Waits for the CloudFormation stack creation process to complete. The
+# stack status is polled with an exponentially increasing delay, so that
+# short stack creations are detected promptly without issuing excessive
+# requests while certificate validation is in progress.
 #
-def createStack(awsRegion, stackName, templateName):
-    createStackCommand = (
-        "aws cloudformation create-stack --region "
-        + awsRegion
-        + " --stack-name "
-        + stackName
-        + " --template-body file://"
-        + templateName
+def waitForStackCreation(cloudFormationClient, stackId):
+    pollDelay = STACK_POLL_MIN_DELAY
+    pollDeadline = time.monotonic() + STACK_POLL_TIMEOUT
+    while True:
+        time.sleep(pollDelay)
+        status = cloudFormationClient.describe_stacks(StackName=stackId)
+        stackInfo = status["Stacks"][0]
+        stackStatus = stackInfo["StackStatus"]
+        if stackStatus == "CREATE_COMPLETE":
+            return
+
+        # Report the reason for any stack creation failure, since the
+        # stack status alone is not sufficient to diagnose the problem.
+        assert stackStatus == "CREATE_IN_PROGRESS", (
+            "Stack creation failed with status "
+            + stackStatus
+            + " : "
+            + stackInfo.get("StackStatusReason", "no reason given")
+        )
+        assert time.monotonic() < pollDeadline, "Timed out waiting for stack creation"
+        pollDelay = min(pollDelay * 2, STACK_POLL_MAX_DELAY)
+
+
+#
+# Initiates the CloudFormation stack creation process and waits for it
+# to complete.
+#
+def createStack(cloudFormationClient, stackName, template):
+    status = cloudFormationClient.create_stack(
+        StackName=stackName, TemplateBody=template
     )
-    with os.popen(createStackCommand, "r") as f:
-        status = json.loads(f.read())
     stackId = status["StackId"]
     print("Creating stack : " + stackId)
-    os.system(
-        "aws cloudformation wait stack-create-complete --region "
-        + awsRegion
-        + " --stack-name "
-        + stackId
-    )
+    waitForStackCreation(cloudFormationClient, stackId)
     print("Stack creation complete")
 
 
@@ -195,31 +255,38 @@ def main(params):
         domainName = params.deployment_stage + "." + params.domain_name
         stackName = params.stack_name + "-" + params.deployment_stage
 
+    # Create the AWS service clients for the selected region.
+    awsSession = boto3.Session(region_name=params.region)
+    route53Client = awsSession.client("route53", config=AWS_CLIENT_CONFIG)
+    cloudFormationClient = awsSession.client("cloudformation", config=AWS_CLIENT_CONFIG)
+
     # Perform pre-deployment checks.
-    dnsHostedZoneId = checkDnsRegistration(domainName)
+    dnsHostedZoneId = checkDnsRegistration(route53Client, domainName)
 
     # Create the CloudFormation template.
-    resources = {}
-    resources.update(createApiCustomDomain(domainName, dnsHostedZoneId))
+    resources = createApiCustomDomain(domainName, dnsHostedZoneId)
     templateData = {"Resources": resources}
-    template = json.dumps(templateData, indent=4)
+    template = json.dumps(templateData, separators=(",", ":"))
+    if params.keep_template:
+        templateName = stackName + "-template.json"
+        print("Writing CloudFormation template to " + templateName)
+        with open(templateName, "w") as f:
+            f.write(template)
 
     # Create the CloudFormation stack.
-    templateName = stackName + "-template.json"
-    print("Writing CloudFormation template to " + templateName)
-    with open(templateName, "w") as f:
-        f.write(template)
-    createStack(params.region, stackName, templateName)
+    createStack(cloudFormationClient, stackName, template)
 
 
 #
-# Run the script with the provided command line options.
+# Run the script with the provided command line options if invoked
+# directly.
 #
-try:
-    params = parseCommandLine()
-    main(params)
-except KeyboardInterrupt as e:
-    exit()
-except Exception as e:
-    print(e)
-    exit()
+if __name__ == "__main__":
+    try:
+        params = parseCommandLine()
+        main(params)
+    except KeyboardInterrupt as e:
+        exit()
+    except Exception as e:
+        print(e)
+        exit()
@@ -0,0 +1,41 @@
+#
+# Capability based API key management service for AWS Lambda with DynamoDB.
+#
+# Copyright (c) 2020, Zynaptic Limited.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+#
+# Please visit www.zynaptic.com or contact reaction@zynaptic.com if you need
+# additional information or have any questions.
+#
+
+#
+# This module provides support functions that are shared by the AWS
+# deployment scripts.
+#
+
+import os
+import botocore.session
+
+#
+# Resolves the AWS region to use when no region has been specified on the
+# command line. The AWS_REGION environment variable is checked first,
+# followed by the standard AWS configuration options, which include the
+# AWS_DEFAULT_REGION environment variable and the AWS configuration file.
+# Returns 'None' if no region has been configured.
+#
+def resolveAwsRegion():
+    awsRegion = os.environ.get("AWS_REGION")
+    if awsRegion == None:
+        awsRegion = botocore.session.get_session().get_config_variable("region")
+    return awsRegion
@@ -23,34 +23,215 @@
 
 #
 # This module supports the generation of CloudFormation templates that
-# can be used to deploy the AWS Lambda based API key manager.
+# can be used to deploy the AWS Lambda based API key manager. The
+# resource template functions add their resources to the specified
+# resources dictionary, which is then returned to the caller.
 #
 
+import copy
 import json
-import configuration
+import hashlib
+import functools
+
+from configuration import (
+    API_KEY_TABLE_DEFAULT_NAME,
+    API_KEY_CACHE_TTL_SECONDS,
+    API_KEY_CACHE_MAX_ENTRIES,
+    API_KEY_TABLE_BILLING_MODE,
+    API_KEY_TABLE_READ_CAPACITY_UNITS,
+    API_KEY_TABLE_WRITE_CAPACITY_UNITS,
+    API_KEY_TABLE_MAX_READ_CAPACITY_UNITS,
+    API_KEY_TABLE_MAX_WRITE_CAPACITY_UNITS,
+    API_KEY_TABLE_TARGET_UTILISATION,
+    AWS_S3_DEFAULT_DEPLOYMENT_BUCKET,
+    AWS_LAMBDA_DEFAULT_PACKAGE_NAME,
+    AWS_LAMBDA_RUNTIME,
+    AWS_LAMBDA_ARTIFACT_KIND,
+    LAMBDA_PROVISIONED_CONCURRENCY,
+    LAMBDA_KEEP_WARM_SCHEDULE,
+    RESOURCE_CUSTOM_DOMAIN_BASE_PATH,
+    RESOURCE_KEY_CREATE_PATH,
+    RESOURCE_KEY_ACCESS_PATH,
+)
+
+#
+# Use the optional orjson package for compact template serialisation if
+# it is available, falling back to the standard JSON encoder otherwise.
+#
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+#
+# Specifies the fixed environment variables that are passed to the API
+# key management Lambda function. The table name is added separately,
+# since it is only known once the table has been created.
+#
+LAMBDA_ENVIRONMENT_VARIABLES = {
+    "AWS_API_RESOURCE_KEY_CREATE_PATH": RESOURCE_KEY_CREATE_PATH,
+    "AWS_API_RESOURCE_KEY_ACCESS_PATH": RESOURCE_KEY_ACCESS_PATH,
+    "AWS_API_KEY_CACHE_TTL_SECONDS": str(API_KEY_CACHE_TTL_SECONDS),
+    "AWS_API_KEY_CACHE_MAX_ENTRIES": str(API_KEY_CACHE_MAX_ENTRIES),
+}
+
+#
+# Specifies the IAM policy statement that allows the API key management
+# Lambda function to access the API key capability table.
+#
+LAMBDA_DATABASE_POLICY_STATEMENT = {
+    "Effect": "Allow",
+    "Action": [
+        "dynamodb:PutItem",
+        "dynamodb:GetItem",
+        "dynamodb:DeleteItem",
+    ],
+    "Resource": {"Fn::GetAtt": ["ApiKeyCapabilityTable", "Arn"]},
+}
+
+#
+# Specifies the IAM policy statement that allows the API key management
+# Lambda function to write to CloudWatch logs.
+#
+LAMBDA_LOGGING_POLICY_STATEMENT = {
+    "Effect": "Allow",
+    "Action": [
+        "logs:CreateLogGroup",
+        "logs:CreateLogStream",
+        "logs:PutLogEvents",
+    ],
+    "Resource": {
+        "Fn::Join": [
+            "",
+            [
+                "arn:aws:logs:",
+                {"Ref": "AWS::Region"},
+                ":",
+                {"Ref": "AWS::AccountId"},
+                ":*",
+            ],
+        ]
+    },
+}
+
+#
+# Specifies the IAM policy statement that allows the API gateway to
+# invoke the API key management Lambda function, either directly or via
+# one of its aliases.
+#
+GATEWAY_LAMBDA_POLICY_STATEMENT = {
+    "Effect": "Allow",
+    "Action": "lambda:InvokeFunction",
+    "Resource": [
+        {"Fn::GetAtt": ["ApiKeyManagementLambda", "Arn"]},
+        {"Fn::Sub": "${ApiKeyManagementLambda.Arn}:*"},
+    ],
+}
+
+#
+# Specifies the API gateway integration URIs for invoking the API key
+# management Lambda function either directly or via its alias.
+#
+LAMBDA_FUNCTION_INVOCATION_URI = {
+    "Fn::Sub": "arn:aws:apigateway:${AWS::Region}:lambda:path/2015-03-31"
+    + "/functions/${ApiKeyManagementLambda.Arn}/invocations"
+}
+LAMBDA_ALIAS_INVOCATION_URI = {
+    "Fn::Sub": "arn:aws:apigateway:${AWS::Region}:lambda:path/2015-03-31"
+    + "/functions/${ApiKeyManagementLambdaAlias}/invocations"
+}
+
+
+#
+# Creates the IAM policy document that allows the specified AWS service
+# to assume a role. Policy documents are static for a given service, so
+# they are cached and shared between templates.
+#
+@functools.lru_cache(maxsize=None)
+def assumeRolePolicyDocument(serviceName):
+    return {
+        "Statement": [
+            {
+                "Effect": "Allow",
+                "Principal": {"Service": [serviceName]},
+                "Action": "sts:AssumeRole",
+            }
+        ]
+    }
+
+
+#
+# Creates the auto scaling resource templates for the provisioned read or
+# write capacity of the API key capability table. The capacity type must
+# be either 'Read' or 'Write'. No auto scaling is used if the maximum
+# capacity does not exceed the minimum capacity. Auto scaling uses the
+# DynamoDB service linked role, so no IAM role is specified.
+#
+def createTableCapacityScaling(capacityType, minCapacity, maxCapacity, resources=None):
+    if resources == None:
+        resources = {}
+    if maxCapacity <= minCapacity:
+        return resources
+
+    # Defines the table capacity dimension that will be scaled.
+    scalingTargetId = "ApiKeyCapabilityTable" + capacityType + "ScalingTarget"
+    resources[scalingTargetId] = {
+        "Type": "AWS::ApplicationAutoScaling::ScalableTarget",
+        "Properties": {
+            "ServiceNamespace": "dynamodb",
+            "ResourceId": {"Fn::Sub": "table/${ApiKeyCapabilityTable}"},
+            "ScalableDimension": "dynamodb:table:" + capacityType + "CapacityUnits",
+            "MinCapacity": minCapacity,
+            "MaxCapacity": maxCapacity,
+        },
+    }
+
+    # Defines the target tracking policy for the capacity utilisation.
+    resources["ApiKeyCapabilityTable" + capacityType + "ScalingPolicy"] = {
+        "Type": "AWS::ApplicationAutoScaling::ScalingPolicy",
+        "Properties": {
+            "PolicyName": {
+                "Fn::Sub": "${ApiKeyCapabilityTable}-" + capacityType + "Scaling"
+            },
+            "PolicyType": "TargetTrackingScaling",
+            "ScalingTargetId": {"Ref": scalingTargetId},
+            "TargetTrackingScalingPolicyConfiguration": {
+                "TargetValue": API_KEY_TABLE_TARGET_UTILISATION,
+                "PredefinedMetricSpecification": {
+                    "PredefinedMetricType": "DynamoDB"
+                    + capacityType
+                    + "CapacityUtilization"
+                },
+            },
+        },
+    }
+    return resources
+
 
 #
 # Creates the resource template for the DynamoDB table that will be used
 # for storing the API key capabilities.
 #
-def createApiKeyCapabilityTable(databaseName):
+def createApiKeyCapabilityTable(databaseName, resources=None):
+    if resources == None:
+        resources = {}
 
     # Set the provisioned billing mode using the specified number of
     # read and write capacity units.
-    if (configuration.API_KEY_TABLE_READ_CAPACITY_UNITS > 0) and (
-        configuration.API_KEY_TABLE_WRITE_CAPACITY_UNITS > 0
-    ):
+    if API_KEY_TABLE_BILLING_MODE == "PROVISIONED":
         billingMode = {
             "BillingMode": "PROVISIONED",
             "ProvisionedThroughput": {
-                "ReadCapacityUnits": configuration.API_KEY_TABLE_READ_CAPACITY_UNITS,
-                "WriteCapacityUnits": configuration.API_KEY_TABLE_WRITE_CAPACITY_UNITS,
+                "ReadCapacityUnits": API_KEY_TABLE_READ_CAPACITY_UNITS,
+                "WriteCapacityUnits": API_KEY_TABLE_WRITE_CAPACITY_UNITS,
             },
         }
 
     # Set the billing mode to use unprovisioned per-transaction billing.
-    else:
+    elif API_KEY_TABLE_BILLING_MODE == "PAY_PER_REQUEST":
         billingMode = {"BillingMode": "PAY_PER_REQUEST"}
+    else:
+        raise ValueError("Invalid table billing mode : " + API_KEY_TABLE_BILLING_MODE)
 
     # Set the fixed table name if required.
     if databaseName != None:
@@ -60,141 +241,229 @@ def createApiKeyCapabilityTable(databaseName):
 
     # Defines the API key capability table using the API key as the
     # primary index.
-    tableDefinition = {
-        "ApiKeyCapabilityTable": {
-            "Type": "AWS::DynamoDB::Table",
-            "Properties": {
-                "AttributeDefinitions": [
-                    {"AttributeName": "apiKey", "AttributeType": "S"}
-                ],
-                "KeySchema": [{"AttributeName": "apiKey", "KeyType": "HASH"}],
-                "TimeToLiveSpecification": {
-                    "Enabled": True,
-                    "AttributeName": "expiryTimestamp",
-                },
-                **billingMode,
-                **tableName,
+    resources["ApiKeyCapabilityTable"] = {
+        "Type": "AWS::DynamoDB::Table",
+        "Properties": {
+            "AttributeDefinitions": [{"AttributeName": "apiKey", "AttributeType": "S"}],
+            "KeySchema": [{"AttributeName": "apiKey", "KeyType": "HASH"}],
+            "TimeToLiveSpecification": {
+                "Enabled": True,
+                "AttributeName": "expiryTimestamp",
             },
-        }
+            **billingMode,
+            **tableName,
+        },
     }
-    return tableDefinition
+
+    # Add auto scaling for the provisioned read and write capacity.
+    if billingMode["BillingMode"] == "PROVISIONED":
+        createTableCapacityScaling(
+            "Read",
+            API_KEY_TABLE_READ_CAPACITY_UNITS,
+            API_KEY_TABLE_MAX_READ_CAPACITY_UNITS,
+            resources,
+        )
+        createTableCapacityScaling(
+            "Write",
+            API_KEY_TABLE_WRITE_CAPACITY_UNITS,
+            API_KEY_TABLE_MAX_WRITE_CAPACITY_UNITS,
+            resources,
+        )
+    return resources
+
+
+#
+# Determines whether the API key management Lambda function should be
+# invoked via an alias for a published version. This is required when
+# using either SnapStart or provisioned concurrency.
+#
+def lambdaAliasRequired():
+    return (LAMBDA_PROVISIONED_CONCURRENCY > 0) or (
+        AWS_LAMBDA_ARTIFACT_KIND == "snapstart-jar"
+    )
 
 
 #
 # Creates the resource template for the AWS Lambda function that is
 # used for API key management.
 #
-def createApiKeyManagementLambda(deploymentBucket, packageName):
+def createApiKeyManagementLambda(deploymentBucket, packageName, resources=None):
+    if resources == None:
+        resources = {}
+
+    # Enable SnapStart for published versions if required.
+    if AWS_LAMBDA_ARTIFACT_KIND == "snapstart-jar":
+        if LAMBDA_PROVISIONED_CONCURRENCY > 0:
+            raise ValueError("SnapStart can not be used with provisioned concurrency")
+        snapStart = {"SnapStart": {"ApplyOn": "PublishedVersions"}}
+    elif AWS_LAMBDA_ARTIFACT_KIND == "jar":
+        snapStart = {}
+    else:
+        raise ValueError("Invalid Lambda artifact kind : " + AWS_LAMBDA_ARTIFACT_KIND)
 
     # Defines the Lambda function using the deployment package settings
     # taken from the configuration file.
-    lambdaDefinition = {
-        "ApiKeyManagementLambda": {
-            "Type": "AWS::Lambda::Function",
-            "Properties": {
-                "Description": "API Key Management Service",
-                "Runtime": "java8",
-                "MemorySize": 256,
-                "Timeout": 30,
-                "Handler": "com.zynaptic.aws.api.key.manager.ApiHandler",
-                "Role": {"Fn::GetAtt": ["ApiKeyManagementLambdaRole", "Arn"]},
-                "Code": {"S3Bucket": deploymentBucket, "S3Key": packageName},
-                "Environment": {
-                    "Variables": {
-                        "AWS_API_KEY_TABLE_NAME": {"Ref": "ApiKeyCapabilityTable"},
-                        "AWS_API_RESOURCE_KEY_CREATE_PATH": configuration.RESOURCE_KEY_CREATE_PATH,
-                        "AWS_API_RESOURCE_KEY_ACCESS_PATH": configuration.RESOURCE_KEY_ACCESS_PATH,
-                    }
-                },
+    resources["ApiKeyManagementLambda"] = {
+        "Type": "AWS::Lambda::Function",
+        "Properties": {
+            "Description": "API Key Management Service",
+            "Runtime": AWS_LAMBDA_RUNTIME,
+            "MemorySize": 256,
+            "Timeout": 30,
+            "Handler": "com.zynaptic.aws.api.key.manager.ApiHandler",
+            "Role": {"Fn::GetAtt": ["ApiKeyManagementLambdaRole", "Arn"]},
+            "Code": {"S3Bucket": deploymentBucket, "S3Key": packageName},
+            "Environment": {
+                "Variables": {
+                    "AWS_API_KEY_TABLE_NAME": {"Ref": "ApiKeyCapabilityTable"},
+                    **LAMBDA_ENVIRONMENT_VARIABLES,
+                }
             },
-        }
+            **snapStart,
+        },
     }
 
     # Defines the IAM role used by the Lambda function. This supports
     # database read, write and delete operations as well as CloudWatch
     # logging.
-    lambdaExecutionRole = {
-        "ApiKeyManagementLambdaRole": {
-            "Type": "AWS::IAM::Role",
+    resources["ApiKeyManagementLambdaRole"] = {
+        "Type": "AWS::IAM::Role",
+        "Properties": {
+            "AssumeRolePolicyDocument": assumeRolePolicyDocument(
+                "lambda.amazonaws.com"
+            ),
+            "Policies": [
+                {
+                    "PolicyName": "ApiKeyCapabilityAccessPolicy",
+                    "PolicyDocument": {"Statement": [LAMBDA_DATABASE_POLICY_STATEMENT]},
+                },
+                {
+                    "PolicyName": "ApiKeyManagementLoggingPolicy",
+                    "PolicyDocument": {"Statement": [LAMBDA_LOGGING_POLICY_STATEMENT]},
+                },
+            ],
+        },
+    }
+
+    # Publish a version of the Lambda function with an alias that is used
+    # for SnapStart or provisioned concurrency, if required.
+    if lambdaAliasRequired():
+        if LAMBDA_PROVISIONED_CONCURRENCY > 0:
+            provisionedConcurrency = {
+                "ProvisionedConcurrencyConfig": {
+                    "ProvisionedConcurrentExecutions": LAMBDA_PROVISIONED_CONCURRENCY
+                }
+            }
+        else:
+            provisionedConcurrency = {}
+        resources["ApiKeyManagementLambdaVersion"] = {
+            "Type": "AWS::Lambda::Version",
+            "Properties": {"FunctionName": {"Ref": "ApiKeyManagementLambda"}},
+        }
+        resources["ApiKeyManagementLambdaAlias"] = {
+            "Type": "AWS::Lambda::Alias",
             "Properties": {
-                "AssumeRolePolicyDocument": {
-                    "Statement": [
-                        {
-                            "Effect": "Allow",
-                            "Principal": {"Service": ["lambda.amazonaws.com"]},
-                            "Action": "sts:AssumeRole",
-                        }
-                    ]
+                "Name": "live",
+                "FunctionName": {"Ref": "ApiKeyManagementLambda"},
+                "FunctionVersion": {
+                    "Fn::GetAtt": ["ApiKeyManagementLambdaVersion", "Version"]
                 },
-                "Policies": [
-                    {
-                        "PolicyName": "ApiKeyCapabilityAccessPolicy",
-                        "PolicyDocument": {
-                            "Statement": [
-                                {
-                                    "Effect": "Allow",
-                                    "Action": [
-                                        "dynamodb:PutItem",
-                                        "dynamodb:GetItem",
-                                        "dynamodb:DeleteItem",
-                                    ],
-                                    "Resource": {
-                                        "Fn::GetAtt": ["ApiKeyCapabilityTable", "Arn"]
-                                    },
-                                }
-                            ]
-                        },
-                    },
-                    {
-                        "PolicyName": "ApiKeyManagementLoggingPolicy",
-                        "PolicyDocument": {
-                            "Statement": [
-                                {
-                                    "Effect": "Allow",
-                                    "Action": [
-                                        "logs:CreateLogGroup",
-                                        "logs:CreateLogStream",
-                                        "logs:PutLogEvents",
-                                    ],
-                                    "Resource": {
-                                        "Fn::Join": [
-                                            "",
-                                            [
-                                                "arn:aws:logs:",
-                                                {"Ref": "AWS::Region"},
-                                                ":",
-                                                {"Ref": "AWS::AccountId"},
-                                                ":*",
-                                            ],
-                                        ]
-                                    },
-                                }
-                            ]
-                        },
-                    },
-                ],
+                **provisionedConcurrency,
             },
         }
+    return resources
+
+
+#
+# Creates the resource templates for a scheduled CloudWatch Events rule
+# that periodically sends a 'warmup' request to the API key management
+# Lambda function, in order to keep a function instance initialised.
+#
+def createLambdaWarmupRule(scheduleExpression, resources=None):
+    if resources == None:
+        resources = {}
+
+    # Use the Lambda function alias if one is being used to invoke the
+    # published version.
+    if lambdaAliasRequired():
+        functionArn = {"Ref": "ApiKeyManagementLambdaAlias"}
+    else:
+        functionArn = {"Fn::GetAtt": ["ApiKeyManagementLambda", "Arn"]}
+
+    # Defines the scheduled rule and its Lambda function target.
+    resources["ApiKeyManagementWarmupRule"] = {
+        "Type": "AWS::Events::Rule",
+        "Properties": {
+            "Description": "API Key Management Service warmup",
+            "ScheduleExpression": scheduleExpression,
+            "State": "ENABLED",
+            "Targets": [
+                {
+                    "Id": "ApiKeyManagementLambda",
+                    "Arn": functionArn,
+                    "Input": '{"warmup":true}',
+                }
+            ],
+        },
     }
-    return {**lambdaDefinition, **lambdaExecutionRole}
+
+    # Allows the scheduled rule to invoke the Lambda function.
+    resources["ApiKeyManagementWarmupPermission"] = {
+        "Type": "AWS::Lambda::Permission",
+        "Properties": {
+            "Action": "lambda:InvokeFunction",
+            "FunctionName": functionArn,
+            "Principal": "events.amazonaws.com",
+            "SourceArn": {"Fn::GetAtt": ["ApiKeyManagementWarmupRule", "Arn"]},
+        },
+    }
+    return resources
+
+
+#
+# Derives the logical ID of the REST API resource element for a given
+# resource path. A stable digest of the path is used so that the same
+# path always maps to the same logical ID and CloudFormation can leave
+# unchanged resources in place. The 48 bit digest makes collisions between
+# resource paths vanishingly unlikely.
+#
+@functools.lru_cache(maxsize=None)
+def gatewayResourceId(resourcePath):
+    pathDigest = hashlib.blake2s(resourcePath.encode("utf-8"), digest_size=6)
+    return "ApiKeyRestResource" + pathDigest.hexdigest().upper()
+
+
+#
+# Splits a conventional resource path name into its path segments. The
+# resource path must start with a '/' character and must contain at least
+# one path segment, with no empty path segments.
+#
+@functools.lru_cache(maxsize=None)
+def parseResourcePath(resourcePath):
+    resourcePathSegments = tuple(resourcePath.split("/"))
+    if (
+        (len(resourcePathSegments) < 2)
+        or (resourcePathSegments[0] != "")
+        or ("" in resourcePathSegments[1:])
+    ):
+        raise ValueError("Invalid resource path : " + resourcePath)
+    return resourcePathSegments[1:]
 
 
 #
 # Creates a set of REST API resource elements from a conventional
-# resource path name.
+# resource path name. Returns the resources dictionary and the logical
+# ID of the resource element for the full resource path.
 #
-def createGatewayResource(resourcePath):
-    resourceSet = {}
+def createGatewayResource(resourcePath, resources=None):
+    if resources == None:
+        resources = {}
     resourceHashSource = ""
-    resourcePathSegments = resourcePath.split("/")
     resourceParent = {"Fn::GetAtt": ["ApiKeyRestGateway", "RootResourceId"]}
-    if resourcePathSegments[0] != "":
-        raise ("Invalid resource path : " + resourcePath)
-    resourcePathSegments = resourcePathSegments[1:]
-    for resourcePathSegment in resourcePathSegments:
+    for resourcePathSegment in parseResourcePath(resourcePath):
         resourceHashSource += "/" + resourcePathSegment
-        resourceId = "ApiKeyRestResource%X" % (abs(hash(resourceHashSource)))
-        resourceSet[resourceId] = {
+        resourceId = gatewayResourceId(resourceHashSource)
+        resources[resourceId] = {
             "Type": "AWS::ApiGateway::Resource",
             "Properties": {
                 "RestApiId": {"Ref": "ApiKeyRestGateway"},
@@ -203,216 +472,223 @@ def createGatewayResource(resourcePath):
             },
         }
         resourceParent = {"Ref": resourceId}
-    return resourceSet
+    return (resources, resourceId)
+
+
+#
+# Creates the API gateway integration that forwards REST API requests to
+# the API key management Lambda function using Lambda proxy mode. When
+# SnapStart or provisioned concurrency is used, requests are forwarded to
+# the Lambda function alias for the published version.
+#
+def createLambdaIntegration():
+    if lambdaAliasRequired():
+        invocationUri = LAMBDA_ALIAS_INVOCATION_URI
+    else:
+        invocationUri = LAMBDA_FUNCTION_INVOCATION_URI
+    return {
+        "Type": "AWS_PROXY",
+        "IntegrationHttpMethod": "POST",
+        "Credentials": {"Fn::GetAtt": ["ApiKeyRestGatewayRole", "Arn"]},
+        "Uri": invocationUri,
+    }
+
+
+#
+# Creates a REST API method that accepts any HTTP method on the specified
+# REST API resource and forwards it to the API key management Lambda
+# function. The method template is added to the specified resources
+# dictionary, which is then returned to the caller.
+#
+def createGatewayMethod(methodId, resourceId, resources=None):
+    if resources == None:
+        resources = {}
+    resources[methodId] = {
+        "Type": "AWS::ApiGateway::Method",
+        "Properties": {
+            "RestApiId": {"Ref": "ApiKeyRestGateway"},
+            "ResourceId": {"Ref": resourceId},
+            "HttpMethod": "ANY",
+            "AuthorizationType": "NONE",
+            "Integration": createLambdaIntegration(),
+        },
+    }
+    return resources
 
 
 #
 # Creates the AWS API gateway template for REST API handling. This only
 # supports regional endpoint configurations.
 #
-def createApiKeyRestGateway(apiGatewayName, stagingName):
+def createApiKeyRestGateway(apiGatewayName, stagingName, resources=None):
+    if resources == None:
+        resources = {}
 
     # Defines the REST gateway that will forward API requests to the
     # API key management Lambda function.
-    restGatewayDefinition = {
-        "ApiKeyRestGateway": {
-            "Type": "AWS::ApiGateway::RestApi",
-            "Properties": {
-                "Name": apiGatewayName,
-                "Description": "API Key Management Service (" + stagingName + ")",
-                "EndpointConfiguration": {"Types": ["REGIONAL"]},
-            },
-        }
+    resources["ApiKeyRestGateway"] = {
+        "Type": "AWS::ApiGateway::RestApi",
+        "Properties": {
+            "Name": apiGatewayName,
+            "Description": "API Key Management Service (" + stagingName + ")",
+            "EndpointConfiguration": {"Types": ["REGIONAL"]},
+        },
     }
 
     # Add the REST resources to the gateway definition.
-    restGatewayDefinition.update(
-        createGatewayResource(configuration.RESOURCE_KEY_CREATE_PATH)
-    )
-    restGatewayDefinition.update(
-        createGatewayResource(configuration.RESOURCE_KEY_ACCESS_PATH)
-    )
+    _, createResourceId = createGatewayResource(RESOURCE_KEY_CREATE_PATH, resources)
+    _, accessResourceId = createGatewayResource(RESOURCE_KEY_ACCESS_PATH, resources)
 
-    # Add the REST key creation method to the gateway definition.
-    restKeyCreateMethodDefinition = {
-        "ApiKeyRestCreateMethod": {
-            "Type": "AWS::ApiGateway::Method",
-            "Properties": {
-                "RestApiId": {"Ref": "ApiKeyRestGateway"},
-                "ResourceId": {
-                    "Ref": "ApiKeyRestResource%X"
-                    % (abs(hash(configuration.RESOURCE_KEY_CREATE_PATH)))
-                },
-                "HttpMethod": "ANY",
-                "AuthorizationType": "NONE",
-                "Integration": {
-                    "Type": "AWS_PROXY",
-                    "IntegrationHttpMethod": "POST",
-                    "Credentials": {"Fn::GetAtt": ["ApiKeyRestGatewayRole", "Arn"]},
-                    "Uri": {
-                        "Fn::Join": [
-                            "",
-                            [
-                                "arn:aws:apigateway:",
-                                {"Ref": "AWS::Region"},
-                                ":lambda:path/2015-03-31/functions/",
-                                {"Fn::GetAtt": ["ApiKeyManagementLambda", "Arn"]},
-                                "/invocations",
-                            ],
-                        ]
-                    },
-                },
-            },
-        }
-    }
-
-    # Add the REST key access method to the gateway definition.
-    restKeyAccessMethodDefinition = {
-        "ApiKeyRestAccessMethod": {
-            "Type": "AWS::ApiGateway::Method",
-            "Properties": {
-                "RestApiId": {"Ref": "ApiKeyRestGateway"},
-                "ResourceId": {
-                    "Ref": "ApiKeyRestResource%X"
-                    % (abs(hash(configuration.RESOURCE_KEY_ACCESS_PATH)))
-                },
-                "HttpMethod": "ANY",
-                "AuthorizationType": "NONE",
-                "Integration": {
-                    "Type": "AWS_PROXY",
-                    "IntegrationHttpMethod": "POST",
-                    "Credentials": {"Fn::GetAtt": ["ApiKeyRestGatewayRole", "Arn"]},
-                    "Uri": {
-                        "Fn::Join": [
-                            "",
-                            [
-                                "arn:aws:apigateway:",
-                                {"Ref": "AWS::Region"},
-                                ":lambda:path/2015-03-31/functions/",
-                                {"Fn::GetAtt": ["ApiKeyManagementLambda", "Arn"]},
-                                "/invocations",
-                            ],
-                        ]
-                    },
-                },
-            },
-        }
-    }
+    # Add the REST key creation and access methods to the gateway definition.
+    createGatewayMethod("ApiKeyRestCreateMethod", createResourceId, resources)
+    createGatewayMethod("ApiKeyRestAccessMethod", accessResourceId, resources)
 
     # Defines the IAM role for invoking the Lambda function.
-    restGatewayRole = {
-        "ApiKeyRestGatewayRole": {
-            "Type": "AWS::IAM::Role",
-            "Properties": {
-                "AssumeRolePolicyDocument": {
-                    "Statement": [
-                        {
-                            "Effect": "Allow",
-                            "Principal": {"Service": ["apigateway.amazonaws.com"]},
-                            "Action": "sts:AssumeRole",
-                        }
-                    ]
-                },
-                "Policies": [
-                    {
-                        "PolicyName": "ApiKeyManagementLambdaPolicy",
-                        "PolicyDocument": {
-                            "Statement": [
-                                {
-                                    "Effect": "Allow",
-                                    "Action": "lambda:InvokeFunction",
-                                    "Resource": {
-                                        "Fn::GetAtt": ["ApiKeyManagementLambda", "Arn"]
-                                    },
-                                }
-                            ]
-                        },
-                    }
-                ],
-            },
-        }
-    }
-    return {
-        **restGatewayDefinition,
-        **restKeyCreateMethodDefinition,
-        **restKeyAccessMethodDefinition,
-        **restGatewayRole,
+    resources["ApiKeyRestGatewayRole"] = {
+        "Type": "AWS::IAM::Role",
+        "Properties": {
+            "AssumeRolePolicyDocument": assumeRolePolicyDocument(
+                "apigateway.amazonaws.com"
+            ),
+            "Policies": [
+                {
+                    "PolicyName": "ApiKeyManagementLambdaPolicy",
+                    "PolicyDocument": {"Statement": [GATEWAY_LAMBDA_POLICY_STATEMENT]},
+                }
+            ],
+        },
     }
+    return resources
 
 
 #
 # Creates the API gateway deployment.
 #
-def createApiGatewayDeployment(stagingName):
+def createApiGatewayDeployment(stagingName, resources=None):
+    if resources == None:
+        resources = {}
 
     # Defines the API deployment information that will be used to make
     # the API available for external access.
-    apiGatewayDeploymentInfo = {
-        "ApiKeyRestGatewayDeployment": {
-            "Type": "AWS::ApiGateway::Deployment",
-            "DependsOn": ["ApiKeyRestCreateMethod", "ApiKeyRestAccessMethod"],
-            "Properties": {
-                "RestApiId": {"Ref": "ApiKeyRestGateway"},
-                "StageName": stagingName,
-            },
-        }
+    resources["ApiKeyRestGatewayDeployment"] = {
+        "Type": "AWS::ApiGateway::Deployment",
+        "DependsOn": ["ApiKeyRestCreateMethod", "ApiKeyRestAccessMethod"],
+        "Properties": {
+            "RestApiId": {"Ref": "ApiKeyRestGateway"},
+            "StageName": stagingName,
+        },
     }
-    return apiGatewayDeploymentInfo
+    return resources
 
 
 #
 # Creates the API custom domain name configuration.
 #
-def createApiCustomDomain(domainName, deploymentStage):
+def createApiCustomDomain(domainName, deploymentStage, resources=None):
+    if resources == None:
+        resources = {}
 
     # Specifies the custom domain to be used and the way in which it is
     # to be mapped to the API. This only supports regional endpoint
     # configurations that have previously been set up.
-    customDomainDefinition = {
-        "ApiKeyRestGatewayMapping": {
-            "Type": "AWS::ApiGateway::BasePathMapping",
-            "DependsOn": "ApiKeyRestGatewayDeployment",
-            "Properties": {
-                "DomainName": domainName,
-                "BasePath": configuration.RESOURCE_CUSTOM_DOMAIN_BASE_PATH,
-                "RestApiId": {"Ref": "ApiKeyRestGateway"},
-                "Stage": deploymentStage,
-            },
-        }
+    resources["ApiKeyRestGatewayMapping"] = {
+        "Type": "AWS::ApiGateway::BasePathMapping",
+        "DependsOn": "ApiKeyRestGatewayDeployment",
+        "Properties": {
+            "DomainName": domainName,
+            "BasePath": RESOURCE_CUSTOM_DOMAIN_BASE_PATH,
+            "RestApiId": {"Ref": "ApiKeyRestGateway"},
+            "Stage": deploymentStage,
+        },
     }
-    return customDomainDefinition
+    return resources
 
 
 #
-# Creates the complete CloudFormation template using the parameters
-# specified in the local configuration file.
+# Builds the complete CloudFormation template data using the parameters
+# specified in the local configuration file. The template data shares
+# the static policy statements and documents defined in this module, so
+# it must not be modified.
 #
-def createTemplate(
-    databaseName=configuration.API_KEY_TABLE_DEFAULT_NAME,
-    deploymentBucket=configuration.AWS_S3_DEFAULT_DEPLOYMENT_BUCKET,
-    packageName=configuration.AWS_LAMBDA_DEFAULT_PACKAGE_NAME,
+def buildTemplateData(
+    databaseName=API_KEY_TABLE_DEFAULT_NAME,
+    deploymentBucket=AWS_S3_DEFAULT_DEPLOYMENT_BUCKET,
+    packageName=AWS_LAMBDA_DEFAULT_PACKAGE_NAME,
     apiGatewayName="ApiKeyManager",
     deploymentStage="production",
     domainName=None,
-    doFormat=False,
 ):
     resources = {}
-    resources.update(createApiKeyCapabilityTable(databaseName))
-    resources.update(createApiKeyManagementLambda(deploymentBucket, packageName))
-    resources.update(createApiKeyRestGateway(apiGatewayName, deploymentStage))
-    resources.update(createApiGatewayDeployment(deploymentStage))
+    createApiKeyCapabilityTable(databaseName, resources)
+    createApiKeyManagementLambda(deploymentBucket, packageName, resources)
+    createApiKeyRestGateway(apiGatewayName, deploymentStage, resources)
+    createApiGatewayDeployment(deploymentStage, resources)
+
+    # Only add the scheduled warmup rule if a schedule has been defined.
+    if LAMBDA_KEEP_WARM_SCHEDULE != "":
+        createLambdaWarmupRule(LAMBDA_KEEP_WARM_SCHEDULE, resources)
 
     # Only add the domain name configuration if a custom domain name has
     # been defined.
     if domainName != None:
-        resources.update(createApiCustomDomain(domainName, deploymentStage))
+        createApiCustomDomain(domainName, deploymentStage, resources)
+    return {"Resources": resources}
 
-    # Convert Python template to JSON.
-    templateData = {"Resources": resources}
+
+#
+# Creates the complete CloudFormation template data using the parameters
+# specified in the local configuration file. A deep copy of the template
+# data is returned, so that it can be safely modified by the caller.
+#
+def createTemplateData(
+    databaseName=API_KEY_TABLE_DEFAULT_NAME,
+    deploymentBucket=AWS_S3_DEFAULT_DEPLOYMENT_BUCKET,
+    packageName=AWS_LAMBDA_DEFAULT_PACKAGE_NAME,
+    apiGatewayName="ApiKeyManager",
+    deploymentStage="production",
+    domainName=None,
+):
+    return copy.deepcopy(
+        buildTemplateData(
+            databaseName,
+            deploymentBucket,
+            packageName,
+            apiGatewayName,
+            deploymentStage,
+            domainName,
+        )
+    )
+
+
+#
+# Creates the complete CloudFormation template as UTF-8 encoded JSON.
+# Compact JSON is used by default to minimise the size of the template.
+#
+def createTemplate(
+    databaseName=API_KEY_TABLE_DEFAULT_NAME,
+    deploymentBucket=AWS_S3_DEFAULT_DEPLOYMENT_BUCKET,
+    packageName=AWS_LAMBDA_DEFAULT_PACKAGE_NAME,
+    apiGatewayName="ApiKeyManager",
+    deploymentStage="production",
+    domainName=None,
+    doFormat=False,
+):
+    templateData = buildTemplateData(
+        databaseName,
+        deploymentBucket,
+        packageName,
+        apiGatewayName,
+        deploymentStage,
+        domainName,
+    )
     if doFormat:
-        template = json.dumps(templateData, indent=4)
+        template = json.dumps(templateData, indent=4).encode("utf-8")
+    elif orjson != None:
+        template = orjson.dumps(templateData)
     else:
-        template = json.dumps(templateData)
+        template = json.dumps(
+            templateData, separators=(",", ":"), ensure_ascii=False
+        ).encode("utf-8")
     return template
 
 
@@ -422,8 +698,8 @@ def createTemplate(
 if __name__ == "__main__":
     try:
         print("Writing CloudFormation template to cloudformation-template.json")
-        with open("cloudformation-template.json", "w") as f:
-            f.write(createTemplate(doFormat=True))
+        with open("cloudformation-template.json", "w", encoding="utf-8") as f:
+            json.dump(buildTemplateData(), f, indent=4)
     except KeyboardInterrupt as e:
         exit()
     except Exception as e:
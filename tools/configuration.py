@@ -21,7 +21,9 @@
 
 #
 # This file specifies the deployment configuration options that will be
-# used when generating the AWS CloudFormation files.
+# used when generating the AWS CloudFormation files. Options should be
+# plain literal values, so that importing this file from any of the
+# deployment tools has no side effects and negligible cost.
 #
 
 #
@@ -30,20 +32,44 @@
 #
 API_KEY_TABLE_DEFAULT_NAME = "ApiKeyTable"
 
+#
+# This option sets the billing mode for the API key capability table.
+# Valid options are 'PAY_PER_REQUEST' and 'PROVISIONED'. Pay per request
+# billing is the default since it avoids throttling during bursts of
+# requests.
+#
+API_KEY_TABLE_BILLING_MODE = "PAY_PER_REQUEST"
+
 #
 # This option sets the read capacity limit for the API key capability
-# table. Reads are required each time an API key is used to authorise
-# a transaction. Set to zero to use pay per request billing mode.
+# table when using provisioned billing mode. Reads are required each
+# time an API key is used to authorise a transaction.
 #
 API_KEY_TABLE_READ_CAPACITY_UNITS = 1
 
 #
 # This option sets the write capacity limit for the API key capability
-# table. Writes are required each time a new API key is generated. Set
-# to zero to used pay per request billing mode.
+# table when using provisioned billing mode. Writes are required each
+# time a new API key is generated.
 #
 API_KEY_TABLE_WRITE_CAPACITY_UNITS = 1
 
+#
+# These options set the maximum read and write capacity limits for the
+# API key capability table when using provisioned billing mode. If the
+# maximum exceeds the base capacity limit set above, DynamoDB auto
+# scaling will be used to adjust the provisioned capacity between the
+# two limits.
+#
+API_KEY_TABLE_MAX_READ_CAPACITY_UNITS = 100
+API_KEY_TABLE_MAX_WRITE_CAPACITY_UNITS = 10
+
+#
+# This option sets the target percentage utilisation of the provisioned
+# capacity for the API key capability table when auto scaling is used.
+#
+API_KEY_TABLE_TARGET_UTILISATION = 70
+
 #
 # This option sets the default name of the AWS S3 deployment bucket that
 # will be used to store the AWS Lambda function deployment package.
@@ -56,6 +82,39 @@ AWS_S3_DEFAULT_DEPLOYMENT_BUCKET = "com-zynaptic-aws-octo-deployment"
 #
 AWS_LAMBDA_DEFAULT_PACKAGE_NAME = "aws-api-key-manager-1.0.0.jar"
 
+#
+# This option sets the AWS Lambda runtime that will be used to run the
+# deployment package.
+#
+AWS_LAMBDA_RUNTIME = "java11"
+
+#
+# This option selects the kind of AWS Lambda deployment package. Valid
+# options are 'jar' for a conventional Java archive and 'snapstart-jar'
+# for a Java archive that is deployed using Lambda SnapStart. SnapStart
+# reduces cold start latency by restoring initialised function snapshots,
+# but can not be combined with provisioned concurrency.
+#
+AWS_LAMBDA_ARTIFACT_KIND = "jar"
+
+#
+# This option sets the number of AWS Lambda function instances that are
+# kept initialised using provisioned concurrency. This avoids the Java
+# cold start latency on API key accesses, at the cost of paying for the
+# idle instances. Set to zero to disable provisioned concurrency.
+#
+LAMBDA_PROVISIONED_CONCURRENCY = 0
+
+#
+# This option sets the CloudWatch Events schedule expression that is used
+# to periodically invoke the AWS Lambda function with a no-op 'warmup'
+# request. This keeps a function instance initialised at very low cost
+# and is usually sufficient for lightly used deployments, as a cheaper
+# alternative to provisioned concurrency. Only one of the two options
+# should normally be used. Set to an empty string to disable.
+#
+LAMBDA_KEEP_WARM_SCHEDULE = "rate(5 minutes)"
+
 #
 # This options sets the default name of the AWS CloudFormation stack.
 #
@@ -85,9 +144,27 @@ RESOURCE_KEY_ACCESS_PATH = "/Keys/{apiKey}"
 
 #
 # This option specifies the size of generated API keys as an integer
-# number of random bytes.
+# number of random bytes. The bytes must always be taken from a
+# cryptographically secure random number generator, such as the Python
+# 'secrets' module or the Java 'SecureRandom' class. Keys are encoded as
+# URL safe Base64 text strings, so sizes divisible by 6 are recommended.
+#
+API_KEY_GENERATION_SIZE = 36
+
+#
+# This option sets the time for which API key capability sets are cached
+# by each AWS Lambda function instance, expressed as an integer number of
+# seconds. This avoids repeated database reads for frequently used keys,
+# but means that deleted keys may remain usable on other instances for up
+# to this period. Set to zero to disable caching.
+#
+API_KEY_CACHE_TTL_SECONDS = 60
+
+#
+# This option sets the maximum number of API key capability sets that are
+# cached by each AWS Lambda function instance.
 #
-API_KEY_GENERATION_SIZE = 30
+API_KEY_CACHE_MAX_ENTRIES = 1024
 
 #
 # This option specifies the name of the API key capability which should